@@ -0,0 +1,383 @@
+import asyncio
+import io
+import logging
+import time
+
+import httpx
+import pytest
+import requests
+import urllib3
+
+from us_census_visualization import us_census
+
+
+def test_json_to_df_uses_header_row():
+    data = [["NAME", "B01001_001E", "B01001_001M", "state"],
+            ["Alabama", "4903185", "-555555555", "01"],
+            ["Alaska", "731545", None, "02"]]
+    df = us_census._json_to_df(data)
+    assert list(df.columns) == ["NAME", "B01001_001E", "B01001_001M", "state"]
+    assert len(df) == 2
+    assert df["B01001_001E"].tolist() == [4903185, 731545]
+    assert df["state"].tolist() == ["01", "02"]
+
+
+def test_json_to_df_without_estimates():
+    df = us_census._json_to_df([["NAICS_TTL", "EMP"], ["Manufacturing", "100"]])
+    assert df["EMP"].tolist() == ["100"]
+
+
+def test_invalid_year_raises_type_error():
+    with pytest.raises(TypeError):
+        us_census.AmComSurv("2019", "B01001", "MYKEY", 1)
+
+
+def test_query_cache_does_not_skip_validation():
+    us_census._amcomsurv_query(2019, "B01001", "MYKEY", 1)
+    with pytest.raises(TypeError):
+        us_census._amcomsurv_query(2019.0, "B01001", "MYKEY", 1)
+    us_census._entrepreneur_query(2018, "MYKEY", "*", False)
+    with pytest.raises(TypeError):
+        us_census._entrepreneur_query(2018, "MYKEY", "*", 0)
+
+
+def test_json_to_df_pyarrow_backend():
+    pytest.importorskip("pyarrow")
+    us_census.set_dtype_backend("pyarrow")
+    try:
+        df = us_census._json_to_df([["NAME", "B01001_001E"], ["Alabama", "4903185"]])
+    finally:
+        us_census.set_dtype_backend("numpy")
+    assert str(df["NAME"].dtype) == "string[pyarrow]"
+    assert df["B01001_001E"].tolist() == [4903185]
+
+
+def test_pyarrow_backend_mixed_json_types_are_strings():
+    pytest.importorskip("pyarrow")
+    data = [["NAME", "cell_value", "time", "B01001_001E"], ["a", "1", 2018, "5"], ["b", 2, 2019, 6]]
+    us_census.set_dtype_backend("pyarrow")
+    try:
+        df = us_census._json_to_df(data)
+    finally:
+        us_census.set_dtype_backend("numpy")
+    assert [str(t) for t in df.dtypes[:3]] == ["string[pyarrow]"] * 3
+    assert df["cell_value"].tolist() == ["1", "2"]
+    assert df["time"].tolist() == ["2018", "2019"]
+    assert df["B01001_001E"].tolist() == [5, 6]
+
+
+def test_pyarrow_backend_needs_pandas_2(monkeypatch):
+    monkeypatch.setattr(us_census.pd, "__version__", "1.5.3")
+    with pytest.raises(ImportError):
+        us_census.set_dtype_backend("pyarrow")
+    assert us_census._DTYPE_BACKEND == "numpy"
+
+
+def test_split_by_state():
+    df = us_census._json_to_df([["NAME", "state"], ["Alabama", "01"], ["Alaska", "02"]])
+    states = us_census.split_by_state(df)
+    assert sorted(states) == ["01", "02"]
+    assert states["02"]["NAME"].tolist() == ["Alaska"]
+
+
+def test_json_to_df_keeps_repeated_columns():
+    df = us_census._json_to_df([["NAME", "B01001_001E", "NAME"], ["Alabama", "1", "Alabama"]])
+    assert list(df.columns) == ["NAME", "B01001_001E", "NAME"]
+    assert us_census._json_to_df([["NAME", "B01001_001E"]]).shape == (0, 2)
+
+
+def test_failed_request_returns_none_with_warning(monkeypatch, caplog):
+    def fail(url):
+        raise ValueError("empty response")
+    monkeypatch.setattr(us_census, "_fetch_json", fail)
+    assert us_census.health(2018) is None
+    assert "empty response" in caplog.text
+
+
+def test_connection_error_returns_none_like_the_async_path(monkeypatch, caplog):
+    class DownSession:
+        def get(self, url, timeout=None):
+            raise requests.ConnectionError("connection refused")
+    monkeypatch.setattr(us_census, "_SESSION", DownSession())
+    assert us_census.get_econ(2017, "resconst") is None
+    assert "connection refused" in caplog.text
+
+
+def test_get_econ_between_time_range(monkeypatch):
+    urls = []
+
+    def fetch(url):
+        urls.append(url)
+        return [["cell_value", "time"], ["1234", "2018-01"]]
+    monkeypatch.setattr(us_census, "_fetch_json", fetch)
+    df = us_census.get_econ(2018, "hv", betweentime=True, year2="2019", m1="01", m2="02")
+    assert df["cell_value"].tolist() == ["1234"]
+    assert "time=from%202018-01%20to%202019-02" in urls[0]
+
+
+def fake_econ_fetch(url):
+    # answers with the requested period as the only row, later years first so results arrive out of order
+    if "/bad?" in url:
+        raise ValueError("unknown subset")
+    period = url.rsplit("time=", 1)[-1]
+    time.sleep((2020 - int(period)) * 0.01)
+    return [["cell_value", "time"], ["1", period]]
+
+
+def test_get_econ_many_keeps_order_and_failures(monkeypatch, caplog):
+    monkeypatch.setattr(us_census, "_fetch_json", fake_econ_fetch)
+    results = us_census.get_econ_many([{"year1": 2015, "subset": "hv"},
+                                       {"year1": 2016, "subset": "bad"},
+                                       {"year1": 2019, "subset": "hv"}], max_workers=3)
+    assert results[0]["time"].tolist() == ["2015"]
+    assert results[1] is None
+    assert results[2]["time"].tolist() == ["2019"]
+    assert "unknown subset" in caplog.text
+
+
+def test_rate_limiter_delays_after_burst():
+    limiter = us_census._RateLimiter(2)
+    assert limiter._reserve() == 0
+    assert limiter._reserve() == 0
+    assert limiter._reserve() > 0
+
+
+def test_configure_only_changes_given_settings():
+    try:
+        us_census.configure(rate=None)
+        assert all(us_census._RATE_LIMITER._reserve() == 0 for _ in range(100))
+        us_census.configure(max_workers=32)
+        assert us_census._RATE_LIMITER.rate is None
+        us_census.configure(rate=2)
+        assert us_census._RATE_LIMITER.rate == 2
+        assert us_census._MAX_WORKERS == 32
+        with pytest.raises(ValueError):
+            us_census.configure(rate=0)
+    finally:
+        us_census.configure(max_workers=64, rate=10)
+    assert us_census._RATE_LIMITER.rate == 10
+
+
+def test_json_to_df_text_columns_are_strings():
+    df = us_census._json_to_df([["NAME", "state"], ["Alabama", "01"], [None, "02"]])
+    assert (df.dtypes == "string").all()
+
+
+def test_build_url_escapes_values():
+    url = us_census._build_url("2019/acs/acs1/spp", {"get": "NAME,group(S0201)", "for": "us:1", "POPGROUP": "a&b c"})
+    assert url == "https://api.census.gov/data/2019/acs/acs1/spp?get=NAME,group(S0201)&for=us:1&POPGROUP=a%26b%20c"
+
+
+def test_lazy_dataframe_projects_single_column():
+    data = [["NAME", "B01001_001E", "state"], ["Alabama", "4903185", "01"], ["Alaska", "731545", "02"]]
+    lazy = us_census.LazyDataFrame(data)
+    assert lazy["B01001_001E"].tolist() == [4903185, 731545]
+    assert lazy._df is None
+    assert len(lazy) == 2
+    assert lazy.shape == (2, 3)
+    assert lazy["NAME"].tolist() == ["Alabama", "Alaska"]
+
+
+ECON_ROWS = [["cell_value", "time"], ["1234", "2018"]]
+
+
+def mock_async_client(monkeypatch, handler):
+    monkeypatch.setattr(us_census, "_new_async_client",
+                        lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+def test_gather_queries_logs_failures_and_keeps_other_results(monkeypatch, caplog):
+    def handler(request):
+        subset = request.url.path.rsplit("/", 1)[-1]
+        if subset == "hv":
+            return httpx.Response(200, json=ECON_ROWS)
+        if subset == "notjson":
+            return httpx.Response(200, content=b"<html>error</html>")
+        if subset == "missing":
+            return httpx.Response(404)
+        raise httpx.ConnectError("connection refused", request=request)
+    mock_async_client(monkeypatch, handler)
+    results = us_census.gather_queries([(us_census.get_econ, (2018, "hv")),
+                                        (us_census.get_econ, (2018, "notjson")),
+                                        (us_census.get_econ, (2018, "missing")),
+                                        (us_census.get_econ, (2018, "down"))])
+    assert results[0]["cell_value"].tolist() == ["1234"]
+    assert results[1:] == [None, None, None]
+    assert caplog.text.count("Economic Indicators survey") == 3
+
+
+def test_gather_queries_closes_its_client(monkeypatch):
+    clients = []
+
+    def new_client():
+        clients.append(httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json=ECON_ROWS))))
+        return clients[-1]
+    monkeypatch.setattr(us_census, "_new_async_client", new_client)
+    us_census.configure(max_workers=8)
+    try:
+        assert us_census.gather_queries([(us_census.get_econ, (2018, "hv"))])[0] is not None
+    finally:
+        us_census.configure(max_workers=64)
+    assert len(clients) == 1 and clients[0].is_closed
+    assert clients[0] not in us_census._ASYNC_CLIENTS.values()
+
+
+def test_async_clients_are_closed_and_not_kept_per_loop(monkeypatch):
+    clients = []
+
+    def new_client():
+        clients.append(httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json=ECON_ROWS))))
+        return clients[-1]
+    monkeypatch.setattr(us_census, "_new_async_client", new_client)
+
+    async def batch(close):
+        await us_census.gather_queries_async([(us_census.get_econ, (2018, "hv"))])
+        if close:
+            await us_census.close_async_client()
+    for _ in range(5):
+        asyncio.run(batch(close=False))
+    # the loops of earlier runs are closed, only the latest entry is still waiting to be dropped
+    assert len(us_census._ASYNC_CLIENTS) == 1
+    asyncio.run(batch(close=True))
+    assert us_census._ASYNC_CLIENTS == {}
+    assert clients[-1].is_closed
+
+
+ACS_ROWS = [["NAME", "B01001_001E", "us"], ["United States", "328239523", "1"]]
+
+
+def test_iter_years_in_order_and_stops_on_break(monkeypatch):
+    urls = []
+
+    def fetch(url):
+        urls.append(url)
+        return ACS_ROWS
+    monkeypatch.setattr(us_census, "_fetch_json", fetch)
+    assert len(list(us_census.iter_years([2017, 2018, 2019], "B01001", "MYKEY", 1))) == 3
+    assert [url.split("/")[4] for url in urls] == ["2017", "2018", "2019"]
+    urls.clear()
+    years = us_census.iter_years(range(2010, 2020), "B01001", "MYKEY", 1)
+    for i, df in enumerate(years):
+        assert df["B01001_001E"].tolist() == [328239523]
+        if i == 1:
+            break
+    years.close()
+    # the two consumed years plus the one fetched ahead
+    assert len(urls) == 3
+
+
+def test_iter_years_async_in_order_and_cancels_prefetch_on_break(monkeypatch):
+    requested, cancelled = [], []
+
+    async def handler(request):
+        year = request.url.path.split("/")[2]
+        requested.append(year)
+        try:
+            await asyncio.sleep(0 if year <= "2011" else 5)
+        except asyncio.CancelledError:
+            cancelled.append(year)
+            raise
+        return httpx.Response(200, json=ACS_ROWS)
+    mock_async_client(monkeypatch, handler)
+    # earlier tests may have used up the shared rate limit, which would hold 2012 back before it reaches the handler
+    monkeypatch.setattr(us_census, "_RATE_LIMITER", us_census._RateLimiter(None))
+
+    async def consume():
+        try:
+            years = us_census.iter_years_async(range(2010, 2020), "B01001", "MYKEY", 1)
+            results = []
+            async for df in years:
+                results.append(df)
+                # the caller works on the dataframe while the next year is fetched
+                await asyncio.sleep(0.01)
+                if len(results) == 2:
+                    break
+            await years.aclose()
+            await asyncio.sleep(0.01)
+            # 2012 was prefetched while the caller looked at 2011 and is cancelled here, not when the loop shuts down
+            assert cancelled == ["2012"]
+            return results
+        finally:
+            await us_census.close_async_client()
+    results = asyncio.run(consume())
+    assert [df["B01001_001E"].tolist() for df in results] == [[328239523], [328239523]]
+    assert requested == ["2010", "2011", "2012"]
+
+
+def test_amcomsurv_many_keeps_order_and_failures(monkeypatch):
+    async def handler(request):
+        year = request.url.path.split("/")[2]
+        if year == "2011":
+            return httpx.Response(404)
+        # earlier years answer last
+        await asyncio.sleep((2020 - int(year)) * 0.01)
+        return httpx.Response(200, json=[["NAME", "B01001_001E", "us"], ["United States", year, "1"]])
+    mock_async_client(monkeypatch, handler)
+    results = us_census.AmComSurv_many([(2010, "B01001", 1), (2011, "B01001", 1), (2019, "B01001", 1)], "MYKEY")
+    assert results[0]["B01001_001E"].tolist() == [2010]
+    assert results[1] is None
+    assert results[2]["B01001_001E"].tolist() == [2019]
+
+
+class FakeSession:
+    def __init__(self, status):
+        self.status = status
+
+    def get(self, url, timeout=None):
+        r = requests.Response()
+        r.status_code, r.reason, r.url, r._content = self.status, "Bad Request", url, b'[["NAME"],["United States"]]'
+        return r
+
+
+def test_api_key_is_not_logged(monkeypatch, caplog):
+    caplog.set_level(logging.DEBUG, logger="us_census_visualization.us_census")
+    for status in (400, 200):
+        monkeypatch.setattr(us_census, "_SESSION", FakeSession(status))
+        us_census.AmComSurv(2019, "B99999", f"SECRETKEY{status}", 1)
+    mock_async_client(monkeypatch, lambda request: httpx.Response(400))
+    assert us_census.gather_queries([(us_census.AmComSurv, (2019, "B99999", "SECRETKEYASYNC", 1))]) == [None]
+    assert "400" in caplog.text and "key=<redacted>" in caplog.text
+    assert "SECRETKEY" not in caplog.text
+
+
+class CountingAdapter(requests.adapters.HTTPAdapter):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        self.calls += 1
+        raw = urllib3.HTTPResponse(body=io.BytesIO(b'[["NAME"],["United States"]]'), status=200,
+                                   headers={"Content-Type": "application/json"}, preload_content=False)
+        return self.build_response(request, raw)
+
+
+def test_disk_cache_serves_repeats_and_clear_cache_empties_both_layers(monkeypatch, tmp_path):
+    pytest.importorskip("requests_cache")
+    monkeypatch.setattr(us_census, "_SESSION", us_census._SESSION)
+    us_census.enable_disk_cache(str(tmp_path / "census"), expire_after=60)
+    adapter = CountingAdapter()
+    us_census._SESSION.mount("https://", adapter)
+    us_census.clear_cache()
+    assert us_census.health(2016)["NAME"].tolist() == ["United States"]
+    # a new process starts with an empty memory cache, the disk still has the response
+    us_census._fetch_json.cache_clear()
+    assert us_census.health(2016)["NAME"].tolist() == ["United States"]
+    assert adapter.calls == 1
+    us_census.clear_cache()
+    assert us_census._fetch_json.cache_info().currsize == 0
+    assert len(us_census._SESSION.cache.responses) == 0
+    us_census.health(2016)
+    assert adapter.calls == 2
+
+
+def test_gather_queries_honours_lazy(monkeypatch):
+    mock_async_client(monkeypatch, lambda request: httpx.Response(200, json=ACS_ROWS))
+    lazy, eager, positional = us_census.gather_queries([(us_census.AmComSurv, (2019, "B01001", "MYKEY", 1), {"lazy": True}),
+                                                        (us_census.AmComSurv, (2019, "B01001", "MYKEY", 1)),
+                                                        (us_census.AmComSurvSubjects, (2019, "S0101", "MYKEY", "", True))])
+    assert isinstance(lazy, us_census.LazyDataFrame) and isinstance(positional, us_census.LazyDataFrame)
+    assert lazy["B01001_001E"].tolist() == [328239523]
+    assert not isinstance(eager, us_census.LazyDataFrame)
+    with pytest.raises(TypeError):
+        us_census.gather_queries([(us_census.get_econ, (2018, "hv"), {"lazy": True})])
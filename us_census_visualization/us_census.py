@@ -1,11 +1,334 @@
+import asyncio
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
 import requests
-import json 
+from urllib.parse import quote, urlencode
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import orjson
 import pandas as pd 
 import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+from us_census_visualization import __version__
 
+logger = logging.getLogger(__name__)
+
+# number of simultaneous connections kept per host, for the requests pool as well as for the async client, see configure
+_MAX_WORKERS = 64
+
+def _make_adapter(max_workers):
+    return HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers,
+                       max_retries=Retry(total=8, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                                         respect_retry_after_header=True, raise_on_status=False))
+
+# one pooled session for every query, so repeated calls reuse the same TCP/TLS connection to api.census.gov
+_ADAPTER = _make_adapter(_MAX_WORKERS)
+
+# census JSON compresses about tenfold; ACCEPT_ENCODING lists every encoding urllib3 can decode here (br once brotli is installed)
+_HEADERS = {'Accept-Encoding': ACCEPT_ENCODING, 'User-Agent': f'us_census_visualization/{__version__}'}
+
+def _configure_session(session):
+    session.mount('http://', _ADAPTER)
+    session.mount('https://', _ADAPTER)
+    session.headers.update(_HEADERS)
+    return session
+
+_SESSION = _configure_session(requests.Session())
+
+# default of configure's arguments, so that only the settings actually passed change (None is a valid rate)
+_UNSET = object()
+
+def configure(max_workers=_UNSET, rate=_UNSET):
+    """Sizes the connection pools to the number of threads or tasks querying at the same time, so no worker has to open
+    (and later discard) a connection of its own, and sets how many requests per second are sent to the API.
+    Settings that are not passed keep their current value.
+
+    Parameters
+    ----------
+    max_workers: int
+        number of concurrent requests expected, e.g. the max_workers given to get_econ_many. 64 initially.
+    rate: float or None
+        average number of requests per second across all threads and tasks, 10 initially; None turns the limit off.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> configure(max_workers=64, rate=20)
+    """
+    global _ADAPTER, _MAX_WORKERS, _RATE_LIMITER
+    if rate is not _UNSET:
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be a positive number of requests per second, or None for no limit")
+        _RATE_LIMITER = _RateLimiter(rate)
+    if max_workers is not _UNSET:
+        old = _ADAPTER
+        _MAX_WORKERS = max_workers
+        _ADAPTER = _make_adapter(max_workers)
+        _configure_session(_SESSION)
+        old.close()
+        # gather_queries opens a client per call and so picks up the new limit; a client already kept open by a running
+        # loop (gather_queries_async, iter_years_async) may be in use and keeps its limit until close_async_client()
+
+class _RateLimiter:
+    """Token bucket shared by threads and coroutines, allowing rate requests per second on average (any number if rate is None)."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reserve(self):
+        # takes a token, possibly borrowing from the future, and returns how long the caller must wait for it
+        if self.rate is None:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def wait(self):
+        time.sleep(self._reserve())
+
+    async def wait_async(self):
+        await asyncio.sleep(self._reserve())
+
+# keeps bulk workflows (thousands of year/state/sector queries) under the census API's burst limits, see configure
+_RATE_LIMITER = _RateLimiter(10)
+
+# HTTP errors quote the request url, which carries the user's API key; anything logged goes through _redact first
+_KEY_PARAM = re.compile(r'([?&]key=)[^&\s\'"]+')
+
+def _redact(text):
+    return _KEY_PARAM.sub(r'\1<redacted>', str(text))
+
+def _parse(r):
+    # orjson decodes the (often multi-megabyte) census tables several times faster than the json module behind r.json()
+    return orjson.loads(r.content)
+
+# census responses for a given url do not change, so the most recent ones are kept in memory (and optionally on disk, see
+# enable_disk_cache); the memory copies never expire, only clear_cache() drops them. Detailed tables run to megabytes,
+# hence the small maxsize
+@functools.lru_cache(maxsize=128)
+def _fetch_json(url):
+    _RATE_LIMITER.wait()
+    r = _SESSION.get(url, timeout=30)
+    r.raise_for_status()
+    logger.debug("%s: %d bytes, Content-Encoding %s", _redact(url), len(r.content), r.headers.get('Content-Encoding', 'identity'))
+    return _parse(r)
+
+# estimate, margin of error, percent estimate and percent margin variables, e.g. B01001_001E or DP05_0001PM
+_NUMERIC_VARIABLE = re.compile(r'_\d+(E|M|PE|PM)$')
+
+_DTYPE_BACKEND = 'numpy'
+
+def set_dtype_backend(backend):
+    """Chooses how the columns of returned dataframes are stored.
+
+    Parameters
+    ----------
+    backend: str
+        'numpy' (default) for regular pandas columns, or 'pyarrow' for Arrow-backed columns, which need less memory
+        for the text columns of large tables. 'pyarrow' requires the pyarrow package and pandas 2.0 or later.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> set_dtype_backend('pyarrow')
+    """
+    global _DTYPE_BACKEND
+    if backend not in ('numpy', 'pyarrow'):
+        raise ValueError("backend must be either 'numpy' or 'pyarrow'")
+    if backend == 'pyarrow':
+        if int(pd.__version__.split('.')[0]) < 2:
+            raise ImportError(f"the 'pyarrow' backend requires pandas 2.0 or later, found pandas {pd.__version__}")
+        import pyarrow  # missing pyarrow should fail here rather than on the first query
+    _DTYPE_BACKEND = backend
+
+@functools.lru_cache(maxsize=256)
+def _numeric_positions(cols):
+    # detailed tables have thousands of columns, classify each header layout only once
+    return frozenset(i for i, col in enumerate(cols) if _NUMERIC_VARIABLE.search(col))
+
+def _json_to_df(data):
+    # the API answers with a list of rows whose first row is the header
+    cols = data[0]
+    numeric = _numeric_positions(tuple(cols))
+    if _DTYPE_BACKEND == 'pyarrow':
+        return _json_to_arrow_df(data, numeric)
+    # one object array for the whole table, then whole-column conversions, skips pandas' per-cell inference on lists of rows
+    arr = np.array(data[1:], dtype=object).reshape(-1, len(cols))
+    columns = {}
+    for i in range(len(cols)):
+        if i in numeric:
+            columns[i] = pd.to_numeric(arr[:, i], errors='coerce', downcast='integer')
+        else:
+            # the dtype is known from the header, so pandas does not have to scan the values to pick one
+            columns[i] = pd.array(arr[:, i], dtype='string')
+    df = pd.DataFrame(columns)
+    # assigned afterwards since group() queries can repeat a column name
+    df.columns = cols
+    return df
+
+def _json_to_arrow_df(data, numeric):
+    import pyarrow as pa
+    cols = data[0]
+    # transpose the rows once so every column becomes a single Arrow array; every column starts out as strings, like
+    # with the numpy backend, since a JSON column can mix strings and numbers and Arrow would reject or guess its type
+    columns = list(zip(*data[1:])) or [()] * len(cols)
+    arrays = [pa.array([None if v is None else str(v) for v in col], type=pa.string()) for col in columns]
+    df = pa.Table.from_arrays(arrays, names=cols).to_pandas(types_mapper=pd.ArrowDtype)
+    for i in numeric:
+        # by position, group() queries can repeat a column name
+        df.isetitem(i, pd.to_numeric(df.iloc[:, i], errors='coerce', dtype_backend='pyarrow'))
+    return df
+
+_API = 'https://api.census.gov/data/'
+_METRO_AREAS = 'metropolitan statistical area/micropolitan statistical area:*'
+_EITS_VARIABLES = 'cell_value,data_type_code,time_slot_id,category_code,seasonally_adj'
+
+def _build_url(path, params):
+    # the census query syntax uses , : * ( ) and / literally, everything else (spaces, & or = inside values) is escaped
+    return f'{_API}{path}?{urlencode(params, safe=",:*()/", quote_via=quote)}'
+
+# the _*_query functions below validate their arguments and describe the request as (endpoint, params, key), params
+# being a tuple of (name, value) pairs; both they and the URL built from their result are memoised, so a repeated query
+# does no string work before the response cache. The _*_query caches are typed: 2019.0 or True must not hit the entry
+# of 2019 or 1 and skip the type checks
+@functools.lru_cache(maxsize=1024)
+def _api_url(endpoint, params, key=None):
+    params = dict(params)
+    if key is not None:
+        params['key'] = key
+    return _build_url(endpoint, params)
+
+# messages logged when a query fails, shared by the synchronous functions and the async batch path
+_ACS_HINT = "This group was not found, please try a valid group for the American Community Survey Year Data."
+_SUPPLEMENTAL_HINT = "This state, year, or key was not found, please try valid inputs for the American Community Supplemental estimates."
+_ENTREPRENEUR_HINT = "This state, year, or key was not found, please try valid inputs for the American Entrepreneurship Survey."
+_BUSINESS_HINT = "This state, year, or key was not found, please try valid inputs for the American Business Survey."
+_MANUFACTURING_HINT = "This state, year, survey number, or manufacturing sector code was not found. Please try valid inputs for the American Manufacturing survey ."
+_STATE_MANUFACTURING_HINT = "This state, year, or manufacturing sector code was not found. Please try valid inputs for the American Manufacturing survey ."
+_ECON_HINT = "This subset, year, or key was not found, please try valid inputs for the Economic Indicators survey."
+
+def _api(endpoint, params, key=None, hint="The census API request failed, please check your inputs again.", lazy=False):
+    """Fetches endpoint with the given query parameters and returns the response as a dataframe (a LazyDataFrame if lazy),
+    or None after logging hint when the request fails: an error status once retries are exhausted, a connection error
+    or timeout, or a body that is not JSON. The async batch path (_query_async) behaves the same way."""
+    try:
+        data = _fetch_json(_api_url(endpoint, params, key))
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("%s (%s)", hint, _redact(e))
+        return None
+    if lazy:
+        return LazyDataFrame(data)
+    return _json_to_df(data)
+
+class LazyDataFrame:
+    """API response that is turned into a pandas dataframe only when it is first used. Selecting a single column
+    with df['B01001_001E'] before that builds just that column, which is much cheaper for wide detailed tables.
+    Any other dataframe attribute or method builds the whole dataframe once and is forwarded to it.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> df = AmComSurv(2019, 'B01001', MYKEY, 1, lazy=True)
+    >>> df['B01001_001E']
+    """
+
+    def __init__(self, data):
+        self._data = data
+        self._df = None
+
+    def materialize(self):
+        """Returns the full pandas dataframe, building it on the first call."""
+        if self._df is None:
+            self._df = _json_to_df(self._data)
+        return self._df
+
+    def __getitem__(self, item):
+        header = self._data[0]
+        if self._df is None and isinstance(item, str) and header.count(item) == 1:
+            i = header.index(item)
+            return _json_to_df([[item]] + [[row[i]] for row in self._data[1:]])[item]
+        return self.materialize()[item]
+
+    def __getattr__(self, name):
+        # only called for attributes LazyDataFrame does not define itself
+        if name.startswith('__') or name in ('_data', '_df'):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+    def __len__(self):
+        return len(self._data) - 1
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __repr__(self):
+        return repr(self.materialize())
+
+def _check_type(value, expected, message):
+    if not isinstance(value, expected):
+        raise TypeError(message)
+
+def _validate_common(year, key=None, state=None):
+    # arguments shared by most queries; key and state are only checked when the query takes them
+    _check_type(year, int, "Years must be specified in full integer format, e.g. 2019")
+    if key is not None:
+        _check_type(key, str, "Make sure your key input is the string version of your key.")
+    if state is not None:
+        _check_type(state, str, "Please check the official US Census list for available state abbreviations, state must be a string")
+
+def enable_disk_cache(cache_name='us_census_cache', expire_after=86400):
+    """Keeps API responses in a SQLite database so repeated queries are answered locally, also across sessions. Requires the requests-cache package.
+
+    Parameters
+    ----------
+    cache_name: str
+        path of the SQLite database, '.sqlite' is appended.
+    expire_after: int
+        number of seconds a cached response stays valid on disk. The last 128 responses are also kept in memory, where
+        they do not expire; call clear_cache() to fetch them again.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> enable_disk_cache()
+    """
+    import requests_cache
+    global _SESSION
+    _SESSION = _configure_session(requests_cache.CachedSession(cache_name, backend='sqlite', expire_after=expire_after))
+
+def clear_cache():
+    """Forgets every cached API response, in memory and on disk, so the next queries fetch fresh data from the API.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> clear_cache()
+    """
+    _fetch_json.cache_clear()
+    if hasattr(_SESSION, 'cache'):
+        _SESSION.cache.clear()
+
+
+@functools.lru_cache(maxsize=1024, typed=True)
+def _amcomsurv_query(year, group, key, yr):
+    _validate_common(year, key)
+    _check_type(group, str, "Make sure you have input the string version of the group.")
+    return f'{year}/acs/acs{yr}', tuple({'get': f'NAME,group({group})', 'for': 'us:1'}.items()), key
 
 #american community survey year data - detailed tables
-def AmComSurv(year, group, key, yr): 
+def AmComSurv(year, group, key, yr, lazy=False): 
     """
     Gets detailed tables for a year given the group number in the american community index. 
 
@@ -19,6 +342,8 @@ def AmComSurv(year, group, key, yr):
         API key requested from US census.gov website
     yr: int
     Only inputs are 1, 3, or 5 for 1 year, 3 year, and 5 year data. If the input is 3 or 5, then the function subtracts from the year argument. Hence, if year is 2010 and yr is 3, data returned will be from 2007-2010.
+    lazy: bool
+        if True, returns a LazyDataFrame that only builds the (possibly thousands of columns wide) dataframe when it is used.
         
     Returns
     -------
@@ -30,22 +355,16 @@ def AmComSurv(year, group, key, yr):
     >>> from us_census import us_census
     >>> AmComSurv(2019, 'B01001', MYKEY, '1')
     """
+    return _api(*_amcomsurv_query(year, group, key, yr), lazy=lazy,
+                hint=_ACS_HINT)
 
-    assert isinstance(year, int), "Years must be specified in full integer format, e.g. 2019"
-    assert isinstance(group, str), "Make sure you have input the string version of the group."
-    assert isinstance(key, str), "Make sure your key input is the string version of your key."
-    r= requests.get(f'https://api.census.gov/data/{year}/acs/acs{yr}?get=NAME,group({group})&for=us:1&key={key}')
-    
-    if r.status_code== 200: 
-        try:
-            df= pd.DataFrame(r.json())
-            return df
-        except (NameError):
-            print("This group was not found, please try a valid group for the American Community Survey Year Data.")
 
+@functools.lru_cache(maxsize=1024, typed=True)
+def _amcomsurvsubjects_query(year, group, key, c=""):
+    return f'{year}/acs/acs1/{c}profile', tuple({'get': f'group({group})', 'for': 'us:1'}.items()), key
 
 #american community survey year data - detailed tables
-def AmComSurvSubjects(year, group, key, c=""):  
+def AmComSurvSubjects(year, group, key, c="", lazy=False):  
     """
     Gets either comparison tables and subject tables for a year given the group number in the american community index. 
 
@@ -60,6 +379,8 @@ def AmComSurvSubjects(year, group, key, c=""):
     c: str
         Gets subject tables or comparison profiles for a year given the group number in the american community index
         if c=c, then comparison table returns. Otherwise subject table is returned. 
+    lazy: bool
+        if True, returns a LazyDataFrame that only builds the (possibly thousands of columns wide) dataframe when it is used.
             
     Returns
     -------
@@ -71,15 +392,17 @@ def AmComSurvSubjects(year, group, key, c=""):
     >>> from us_census import us_census
     >>> AmComSurvSubjects(2019, "CP05", MYKEY, c='c')
     """
-    r= requests.get(f'https://api.census.gov/data/{year}/acs/acs1/{c}profile?get=group({group})&for=us:1&key={key}')
-    if r.status_code== 200: 
-        try:
-            df= pd.DataFrame(r.json())
-            return df
-        except (NameError):
-            print("This group was not found, please try a valid group for the American Community Survey Year Data.")
-
-def AmComSurv_PopProfile(year, group, popgroup, key): #example: AmComSurv_PopProfile(2019, 'S0201', '001', MYKEY)
+    return _api(*_amcomsurvsubjects_query(year, group, key, c), lazy=lazy,
+                hint=_ACS_HINT)
+
+@functools.lru_cache(maxsize=1024, typed=True)
+def _amcomsurv_popprofile_query(year, group, popgroup, key):
+    _validate_common(year, key)
+    _check_type(group, str, "Make sure you have input the string version of the group.")
+    _check_type(popgroup, str, "Make sure your popgroup input is a string")
+    return f'{year}/acs/acs1/spp', tuple({'get': f'NAME,group({group})', 'for': 'us:1', 'POPGROUP': popgroup}.items()), key
+
+def AmComSurv_PopProfile(year, group, popgroup, key, lazy=False): #example: AmComSurv_PopProfile(2019, 'S0201', '001', MYKEY)
     """
     Gets selected population profiles for a year given the group number and population subgroup in the american community index. 
 
@@ -93,6 +416,8 @@ def AmComSurv_PopProfile(year, group, popgroup, key): #example: AmComSurv_PopPro
         Subgroup of the population (more specificly indexed by demographics than the group parameter)
     key: str
         API key requested from US census.gov website
+    lazy: bool
+        if True, returns a LazyDataFrame that only builds the (possibly thousands of columns wide) dataframe when it is used.
 
         
     Returns
@@ -105,19 +430,15 @@ def AmComSurv_PopProfile(year, group, popgroup, key): #example: AmComSurv_PopPro
     >>> from us_census import us_census
     >>> AmComSurv_PopProfile(2009, 'S0201', '001', MYKEY)
      """
-    assert isinstance(year, int), "Years must be specified in full integer format, e.g. 2019"
-    assert isinstance(group, str), "Make sure you have input the string version of the group."
-    assert isinstance(key, str), "Make sure your key input is the string version of your key."
-    assert isinstance(popgroup, str), "Make sure your popgroup input is a string"
-    r= requests.get(f'https://api.census.gov/data/{year}/acs/acs1/spp?get=NAME,group({group})&for=us:1&POPGROUP={popgroup}&key={key}')
-    if r.status_code== 200: 
-        try:
-            df= pd.DataFrame(r.json())
-            return df
-        except (NameError):
-            print("This group was not found, please try a valid group for the American Community Survey Year Data.")
+    return _api(*_amcomsurv_popprofile_query(year, group, popgroup, key), lazy=lazy,
+                hint=_ACS_HINT)
     
 
+@functools.lru_cache(maxsize=1024, typed=True)
+def _yrsupplemental_query(year, key, state="*"):
+    _validate_common(year, key, state)
+    return f'{year}/acs/acsse', tuple({'get': 'NAME,K200101_001E', 'for': f'state:{state}'}.items()), key
+
 def YrSupplemental(year, key,state= "*"): 
     """
     Returns selected supplemental estimate data for all states in the given year. Has options for specifying a state. 
@@ -127,7 +448,8 @@ def YrSupplemental(year, key,state= "*"):
     year: int
         Only full 4-integer values for years where the Community Survey is available, 2009-2019
     state: str
-        takes state code in string format for state-wide information
+        takes state code in string format for state-wide information. Keep the default '*' to get every state in one request
+        rather than calling once per state, see split_by_state.
     key: str
         API key requested from US census.gov website
 
@@ -142,15 +464,15 @@ def YrSupplemental(year, key,state= "*"):
     >>> from us_census import us_census
     >>> YrSupplemental(2019, MYKEY)
     """
-    assert isinstance(year, int),  "Years must be specified in full integer format, e.g. 2019"
-    assert isinstance(state, str), "Please check the official US Census list for available state abbreviations, state must be a string"
-    r= requests.get(f'https://api.census.gov/data/{year}/acs/acsse?get=NAME,K200101_001E&for=state:{state}&key={key}')
-    if r.status_code== 200: 
-        try:
-            df= pd.DataFrame(r.json())
-            return df
-        except (NameError):
-            print("This state, year, or key was not found, please try valid inputs for the American Community Supplemental estimates.")
+    return _api(*_yrsupplemental_query(year, key, state),
+                hint=_SUPPLEMENTAL_HINT)
+
+@functools.lru_cache(maxsize=1024, typed=True)
+def _entrepreneur_query(year, key, state="*", micro=False):
+    _validate_common(year, key, state)
+    _check_type(micro, bool, "Make sure micro is set to true or false.")
+    area = _METRO_AREAS if micro else f'state:{state}'
+    return f'{year}/ase/csa', tuple({'get': 'VET_GROUP_LABEL', 'for': area}.items()), key
 
 def entrepreneur(year,key, state= "*", micro= False):  
     """Returns data on entrepreneurship information by state. If micro = true, then it will return micro metropolitan data by state for specified areas.
@@ -160,7 +482,8 @@ def entrepreneur(year,key, state= "*", micro= False):
     year:int
         Only full 4-integer values for years where the Community Survey is available, 2009-2019
     state: str
-        takes state code in string format for state-wide information
+        takes state code in string format for state-wide information. Keep the default '*' to get every state in one request
+        rather than calling once per state, see split_by_state.
     key: str
         API key requested from US census.gov website, string format
     micro: bool
@@ -176,25 +499,15 @@ def entrepreneur(year,key, state= "*", micro= False):
     --------
     >>> from us_census import us_census
     >>> entrepreneur(2016, MYKEY)""" 
-    assert isinstance(year, int),  "Years must be specified in full integer format, e.g. 2019"
-    assert isinstance(state, str), "Please check the official US Census list for available state abbreviations, state must be a string"
-    assert isinstance(micro, bool), "Make sure micro is set to true or false."
-    if micro== False:
-        r= requests.get(f'https://api.census.gov/data/{year}/ase/csa?get=VET_GROUP_LABEL&for=state:{state}&key={key}')
-        if r.status_code== 200: 
-            try:
-                df= pd.DataFrame(r.json())
-                return df
-            except (NameError):
-                print("This state, year, or key was not found, please try valid inputs for the American Entrepreneurship Survey.")
-    elif micro== True: 
-        r= requests.get(f'https://api.census.gov/data/{year}/ase/csa?get=VET_GROUP_LABEL&for=metropolitan%20statistical%20area/micropolitan%20statistical%20area:*&key={key}')
-        if r.status_code == 200: 
-            try:
-                df= pd.DataFrame(r.json())
-                return df
-            except (NameError):
-                print("This state, year, or key was not found, please try valid inputs for the American Entrepreneurship Survey.")
+    return _api(*_entrepreneur_query(year, key, state, micro),
+                hint=_ENTREPRENEUR_HINT)
+
+@functools.lru_cache(maxsize=1024, typed=True)
+def _business_query(year, key, state='*', micro=False):
+    _validate_common(year, key, state)
+    _check_type(micro, bool, "Make sure micro is set to true or false.")
+    area = _METRO_AREAS if micro else f'state:{state}'
+    return f'{year}/ase/cscb', tuple({'get': 'RCPPDEMP_F', 'for': area}.items()), key
 
 def business(year, key, state= '*', micro= False):
     """Gives statistics for the characteristics of a business, has option for microdata using micro=True..
@@ -204,7 +517,8 @@ def business(year, key, state= '*', micro= False):
     year: int
         Only full 4-integer values for years where the Community Survey is available, 2009-2019
     state: str
-        takes state code in string format for state-wide information
+        takes state code in string format for state-wide information. Keep the default '*' to get every state in one request
+        rather than calling once per state, see split_by_state.
     key: str
         API key requested from US census.gov website, string format
     micro:
@@ -220,25 +534,15 @@ def business(year, key, state= '*', micro= False):
     --------
     >>> from us_census import us_census
     >>> business(2016, MYKEY)""" 
-    assert isinstance(year, int),  "Years must be specified in full integer format, e.g. 2019"
-    assert isinstance(state, str), "Please check the official US Census list for available state abbreviations, state must be a string"
-    assert isinstance(micro, bool), "Make sure micro is set to true or false."
-    if micro== False:
-        r= requests.get(f'https://api.census.gov/data/{year}/ase/cscb?get=RCPPDEMP_F&for=state:{state}&key={key}')
-        if r.status_code== 200: 
-            try:
-                df= pd.DataFrame(r.json())
-                return df
-            except (NameError):
-                print("This state, year, or key was not found, please try valid inputs for the American Business Survey.")
-    elif micro== True: 
-        r= requests.get(f'https://api.census.gov/data/{year}/ase/cscb?get=RCPPDEMP_F&for=metropolitan%20statistical%20area/micropolitan%20statistical%20area:*&key={key}')
-        if r.status_code == 200: 
-            try:
-                df= pd.DataFrame(r.json())
-                return df
-            except (NameError):
-                print("This state, year, or key was not found, please try valid inputs for the American Business Survey.")
+    return _api(*_business_query(year, key, state, micro),
+                hint=_BUSINESS_HINT)
+
+@functools.lru_cache(maxsize=1024, typed=True)
+def _manufacturing_query(year, manu, key):
+    _validate_common(year, key)
+    _check_type(manu, str, "Please check the official US Census list for available manufacturing sector abbreviations, must be a string")
+    return f'timeseries/asm/area{year}', tuple({'get': f'NAICS{year}_LABEL,NAICS{year},EMP', 'for': 'us:*', 'YEAR': year + 1,
+                                                f'NAICS{year}': manu}.items()), key
 
 def manufacturing(year,manu, key): 
     """Returns information on a given manufacturing sector in a given year's survey across the US.
@@ -262,15 +566,15 @@ def manufacturing(year,manu, key):
     --------
     >>> from us_census import us_census
     >>> manufacturing(2017, '31-33', MYKEY)""" 
-    assert isinstance(year, int),  "Years must be specified in full integer format, e.g. 2019"
-    assert isinstance(manu, str), "Please check the official US Census list for available manufacturing sector abbreviations, must be a string"
-    r= requests.get(f'https://api.census.gov/data/timeseries/asm/area{year}?get=NAICS{year}_LABEL,NAICS{year},EMP&for=us:*&YEAR={year+1}&NAICS{year}={manu}&key={key}')
-    if r.status_code== 200: 
-        try:
-            df= pd.DataFrame(r.json())
-            return df
-        except (NameError):
-            print("This state, year, survey number, or manufacturing sector code was not found. Please try valid inputs for the American Manufacturing survey .")
+    return _api(*_manufacturing_query(year, manu, key),
+                hint=_MANUFACTURING_HINT)
+
+@functools.lru_cache(maxsize=1024, typed=True)
+def _state_manufacturing_query(key, year, manu, crosssection, state='*'):
+    _validate_common(year, key, state)
+    _check_type(manu, str, "Ensure the manufacturing sector is viable")
+    return f'timeseries/asm/{crosssection}', tuple({'get': 'NAICS_TTL,EMP,GEO_TTL', 'for': f'state:{state}', 'YEAR': year,
+                                                    'NAICS': manu}.items()), key
 
 def state_manufacturing(key, year,manu, crosssection, state='*'): #cross-section can equal state or industry only
     """Getting state manunfacturing data for a certain sector, can provide nation-wide or specific state data.
@@ -287,7 +591,8 @@ def state_manufacturing(key, year,manu, crosssection, state='*'): #cross-section
     crosssection: str
         only takes the string arguments 'state' or 'industry' to return a dataframe across the specified cross-section.
     state: str
-        string argument for state code 
+        string argument for state code. Keep the default '*' to get every state in one request
+        rather than calling once per state, see split_by_state.
 
     Returns
     -------
@@ -298,20 +603,16 @@ def state_manufacturing(key, year,manu, crosssection, state='*'): #cross-section
     --------
     >>> from us_census import us_census
     >>> state_manufacturing(MYKEY, 2016, '31-33', 'state')""" 
-    assert isinstance(state, str), "Please check the official US Census list for available state abbreviations, state must be a string"
-    assert isinstance(year, int), "Please only ask for available years and ensure the year entry is an integer"
-    assert isinstance(manu, str), "Ensure the manufacturing sector is viable"
-    r= requests.get(f'https://api.census.gov/data/timeseries/asm/{crosssection}?get=NAICS_TTL,EMP,GEO_TTL&for=state:{state}&YEAR={year}&NAICS={manu}&key={key}')
-    if r.status_code== 200: 
-        try:
-            df= pd.DataFrame(r.json())
-            return df
-        except (NameError):
-            print("This state, year, or manufacturing sector code was not found. Please try valid inputs for the American Manufacturing survey .")
-    else:
-        print("An error occured with your get request. Please check your inputs again.")
+    return _api(*_state_manufacturing_query(key, year, manu, crosssection, state),
+                hint=_STATE_MANUFACTURING_HINT)
 
 
+@functools.lru_cache(maxsize=1024, typed=True)
+def _unemployed_query(year, manu, key, state='*'):
+    _validate_common(year, key, state)
+    _check_type(manu, str, "Ensure the manufacturing sector is viable and a string.")
+    return f'{year}/nonemp', tuple({'get': 'NRCPTOT,NAME', 'for': 'county:*', 'in': f'state:{state}', f'NAICS{year}': manu}.items()), key
+
 def unemployed(year,manu, key,state='*'): #ex manu= 54 is professional, scientific, and technical service industries, year= 2017
     """Yearly data on self-employed manufacturing sectors for all counties. Returns all receipts in thousands of dollars for all counties for the specified state for certain industries.
 
@@ -325,7 +626,8 @@ def unemployed(year,manu, key,state='*'): #ex manu= 54 is professional, scientif
         API key requested from US census.gov website, string format
 
     state: str
-        string argument for state code 
+        string argument for state code. Keep the default '*' to get every state in one request
+        rather than calling once per state, see split_by_state.
 
     Returns
     -------
@@ -336,16 +638,14 @@ def unemployed(year,manu, key,state='*'): #ex manu= 54 is professional, scientif
     --------
     >>> from us_census import us_census
     >>> unemployed(2002, '54', MYKEY, '02')""" 
-    assert isinstance(year, int), "Please only ask for available years and ensure the year entry is an integer"
-    assert isinstance(manu, str), "Ensure the manufacturing sector is viable and a string."
-    assert isinstance(state, str)
-    r= requests.get(f'http://api.census.gov/data/{year}/nonemp?get=NRCPTOT,NAME&for=county:*&in=state:{state}&NAICS{year}={manu}&key={key}')
-    if r.status_code== 200: 
-        try:
-            df= pd.DataFrame(r.json())
-            return df
-        except (NameError):
-            print("This state, year, or manufacturing sector code was not found. Please try valid inputs for the American Manufacturing survey .")
+    return _api(*_unemployed_query(year, manu, key, state),
+                hint=_STATE_MANUFACTURING_HINT)
+
+@functools.lru_cache(maxsize=1024, typed=True)
+def _county_business_patterns_query(year, manu, state='*'):
+    _validate_common(year, state=state)
+    _check_type(manu, str, "Ensure the manufacturing sector is viable and a string.")
+    return f'{year}/cbp', tuple({'get': f'ESTAB,LFO,NAICS{year-1}_LABEL,NAME', 'for': f'state:{state}', f'NAICS{year-1}': manu}.items()), None
 
 def county_business_patterns(year, manu, state='*'):
     """Function that returns dataframe on county business patterns across different manufacturing industries, states, and years.
@@ -358,7 +658,8 @@ def county_business_patterns(year, manu, state='*'):
         string for a manufacturing sector code
 
     state: str
-        string argument for state code 
+        string argument for state code. Keep the default '*' to get every state in one request
+        rather than calling once per state, see split_by_state.
 
     Returns
     -------
@@ -369,15 +670,15 @@ def county_business_patterns(year, manu, state='*'):
     --------
     >>> from us_census import us_census
     >>> county_business_patterns(2018, '72', state='06')""" 
-    assert isinstance(year, int), "Please only ask for available years and ensure the year entry is an integer"
-    assert isinstance(manu, str), "Ensure the manufacturing sector is viable and a string."
-    r= requests.get(f'https://api.census.gov/data/{year}/cbp?get=ESTAB,LFO,NAICS{year-1}_LABEL,NAME&for=state:{state}&NAICS{year-1}={manu}')
-    if r.status_code==200:
-        try:
-            df= pd.DataFrame(r.json())
-            return df
-        except(NameError):
-            print('This state, year, or manufacturing sector code was not found. Please try valid inputs for the American Manufacturing survey .')
+    return _api(*_county_business_patterns_query(year, manu, state),
+                hint=_STATE_MANUFACTURING_HINT)
+
+@functools.lru_cache(maxsize=1024, typed=True)
+def _get_econ_query(year1, subset, betweentime=False, year2='', m1='', m2=''):
+    _validate_common(year1)
+    _check_type(subset, str, "Subset can be strings hv or resconst")
+    period = f'from {year1}-{m1} to {year2}-{m2}' if betweentime else year1
+    return f'timeseries/eits/{subset}', tuple({'get': _EITS_VARIABLES, 'time': period}.items()), None
 
 def get_econ(year1,subset, betweentime= False, year2='', m1= '', m2= ''): #subset=hv is housing, resconst is new residential reconstruction info
     """ Function that extracts economic time-series data.
@@ -407,24 +708,12 @@ def get_econ(year1,subset, betweentime= False, year2='', m1= '', m2= ''): #subse
     >>> from us_census import us_census
     >>> get_econ(2018, 'hv')
     """ 
-    assert isinstance(year1, int), "Year must be an integer"
-    assert isinstance(subset, str), "Subset can be strings hv or resconst"
-    if betweentime== False:
-        r= requests.get(f'https://api.census.gov/data/timeseries/eits/{subset}?get=cell_value,data_type_code,time_slot_id,category_code,seasonally_adj&time={year1}')
-        if r.status_code==200: 
-            try:
-                df= pd.DataFrame(r.json())
-                return df
-            except(NameError):
-                print("This subset, year, or key was not found, please try valid inputs for the Economic Indicators survey.")
-    elif betweentime==True:
-        r2=requests.get(f'https://api.census.gov/data/timeseries/eits/{subset}?get=cell_value,data_type_code,time_slot_id,category_code,seasonally_adj&time=from+{year1}-{m1}+to+{year2}-{m2}')
-        if r2.status_code==200:
-            try:
-                df= pd.DataFrame
-                return df
-            except(NameError):
-                print("This subset, year, or key was not found, please try valid inputs for the Economic Indicators survey.")
+    return _api(*_get_econ_query(year1, subset, betweentime, year2, m1, m2),
+                hint=_ECON_HINT)
+
+@functools.lru_cache(maxsize=1024, typed=True)
+def _health_query(year, state='*', county='*'):
+    return 'timeseries/healthins/sahie', tuple({'get': 'NIC_PT,NUI_PT', 'for': f'county:{county}', 'in': f'state:{state}', 'time': year}.items()), None
 
 def health(year, state='*', county='*'):
     """ Gets percentages of people insured and not insured in county, state, and year specified. If county and state are not specified, will get
@@ -449,12 +738,354 @@ def health(year, state='*', county='*'):
     --------
     >>> from us_census import us_census
     >>> health(2018, '02')"""
-    r= requests.get(f'http://api.census.gov/data/timeseries/healthins/sahie?get=NIC_PT,NUI_PT&for=county:{county}&in=state:{state}&time={year}')
-    if r.status_code==200: 
-            try:
-                df= pd.DataFrame(r.json())
-                return df
-                return df.describe()
-            except(NameError):
-                print("This subset, year, or key was not found, please try valid inputs for the Economic Indicators survey.")
-    
+    return _api(*_health_query(year, state, county),
+                hint=_ECON_HINT)
+
+
+def split_by_state(df):
+    """Splits a dataframe covering several states (queried with state='*') into one dataframe per state.
+
+    Parameters
+    ----------
+    df: dataframe
+        dataframe returned by one of the query functions, with a 'state' column.
+
+    Returns
+    -------
+    dict
+        state code mapped to the rows of that state.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> split_by_state(business(2016, MYKEY))['06']
+    """
+    if df is None:
+        return None
+    return {state: rows.reset_index(drop=True) for state, rows in df.groupby('state')}
+
+def YrSupplemental_all_states(year, key):
+    """Supplemental estimate data for every state from a single API request.
+
+    Parameters
+    ----------
+    year: int
+        Only full 4-integer values for years where the Community Survey is available, 2009-2019
+    key: str
+        API key requested from US census.gov website
+
+    Returns
+    -------
+    dict
+        state code mapped to a pandas dataframe from the Supplemental Year Survey
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> YrSupplemental_all_states(2019, MYKEY)['06']
+    """
+    return split_by_state(YrSupplemental(year, key, state='*'))
+
+def entrepreneur_all_states(year, key):
+    """Entrepreneurship data for every state from a single API request.
+
+    Parameters
+    ----------
+    year: int
+        Only full 4-integer values for years where the Community Survey is available, 2009-2019
+    key: str
+        API key requested from US census.gov website, string format
+
+    Returns
+    -------
+    dict
+        state code mapped to a pandas dataframe from the entrepreneurship survey
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> entrepreneur_all_states(2016, MYKEY)['06']
+    """
+    return split_by_state(entrepreneur(year, key, state='*'))
+
+def state_manufacturing_all(key, year, manu, crosssection='state'):
+    """State manufacturing data of a sector for every state from a single API request.
+
+    Parameters
+    ----------
+    key: str
+        API key requested from US census.gov website, string format
+    year: int
+        Only full 4-integer values for years where the Community Survey is available, 2009-2019
+    manu: str
+        string for a manufacturing sector code
+    crosssection: str
+        only takes the string arguments 'state' or 'industry'.
+
+    Returns
+    -------
+    dict
+        state code mapped to a pandas dataframe from the census manufacturing survey
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> state_manufacturing_all(MYKEY, 2016, '31-33')['06']
+    """
+    return split_by_state(state_manufacturing(key, year, manu, crosssection, state='*'))
+
+def get_econ_many(queries, max_workers=16):
+    """Runs several get_econ queries at the same time on a pool of threads, so the whole batch takes about as long as the slowest query.
+
+    Parameters
+    ----------
+    queries: list
+        dictionaries of get_econ keyword arguments, e.g. {'year1': 2018, 'subset': 'hv'}
+    max_workers: int
+        number of requests in flight at once.
+
+    Returns
+    -------
+    list
+        Pandas dataframes in the same order as queries, None for queries that did not succeed.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> get_econ_many([{'year1': year, 'subset': subset} for year in range(2015, 2020) for subset in ('hv', 'resconst')])
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        return list(ex.map(lambda q: get_econ(**q), queries))
+
+
+_QUERIES = {
+    AmComSurv: (_amcomsurv_query, _ACS_HINT),
+    AmComSurvSubjects: (_amcomsurvsubjects_query, _ACS_HINT),
+    AmComSurv_PopProfile: (_amcomsurv_popprofile_query, _ACS_HINT),
+    YrSupplemental: (_yrsupplemental_query, _SUPPLEMENTAL_HINT),
+    entrepreneur: (_entrepreneur_query, _ENTREPRENEUR_HINT),
+    business: (_business_query, _BUSINESS_HINT),
+    manufacturing: (_manufacturing_query, _MANUFACTURING_HINT),
+    state_manufacturing: (_state_manufacturing_query, _STATE_MANUFACTURING_HINT),
+    unemployed: (_unemployed_query, _STATE_MANUFACTURING_HINT),
+    county_business_patterns: (_county_business_patterns_query, _STATE_MANUFACTURING_HINT),
+    get_econ: (_get_econ_query, _ECON_HINT),
+    health: (_health_query, _ECON_HINT),
+}
+
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+def _retry_delay(headers, attempt):
+    try:
+        return float(headers.get('Retry-After', 2 ** attempt))
+    except ValueError:
+        return 2 ** attempt
+
+async def _async_get(client, url, retries=5):
+    for attempt in range(retries + 1):
+        await _RATE_LIMITER.wait_async()
+        response = await client.get(url, timeout=30)
+        if response.status_code in _RETRY_STATUSES and attempt < retries:
+            await asyncio.sleep(_retry_delay(response.headers, attempt))
+            continue
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+# one HTTP/2 client per running event loop, kept open so later batches on the same loop reuse its connection; HTTP/2
+# multiplexes all concurrent requests over a single TLS connection to api.census.gov instead of one TCP connection each.
+# close_async_client() closes it; entries of loops that were closed without doing so are dropped on the next lookup
+_ASYNC_CLIENTS = {}
+
+def _async_client():
+    loop = asyncio.get_running_loop()
+    for old in [old for old in _ASYNC_CLIENTS if old.is_closed()]:
+        # its connections died with the loop, there is nothing left to await
+        del _ASYNC_CLIENTS[old]
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        client = _new_async_client()
+        _ASYNC_CLIENTS[loop] = client
+    return client
+
+def _new_async_client():
+    limits = httpx.Limits(max_connections=_MAX_WORKERS, max_keepalive_connections=20)
+    return httpx.AsyncClient(http2=True, limits=limits, headers={'User-Agent': _HEADERS['User-Agent']})
+
+async def _query_async(client, func, args=(), kwargs=None):
+    # mirrors _api: a failed request (error status, connection error or timeout, body that is not JSON) is logged and
+    # becomes None instead of failing the whole batch
+    query, hint = _QUERIES[func]
+    # bound against the public function, so its arguments (including lazy, positional or not) are accepted as they are
+    arguments = inspect.signature(func).bind(*args, **(kwargs or {})).arguments
+    lazy = arguments.pop('lazy', False)
+    endpoint, params, key = query(**arguments)
+    try:
+        data = await _async_get(client, _api_url(endpoint, params, key))
+    except (httpx.HTTPError, ValueError) as e:
+        logger.warning("%s (%s)", hint, _redact(e))
+        return None
+    if lazy:
+        return LazyDataFrame(data)
+    return _json_to_df(data)
+
+async def gather_queries_async(calls):
+    """Coroutine version of gather_queries, for use inside an already running event loop (e.g. a Jupyter notebook).
+    The connection stays open for later calls on the same loop until close_async_client() is awaited.
+
+    Parameters
+    ----------
+    calls: list
+        (function, args) or (function, args, kwargs) tuples, where function is one of the query functions of this module.
+        lazy=True is honoured for the functions that take it and gives a LazyDataFrame.
+
+    Returns
+    -------
+    list
+        Pandas dataframes in the same order as calls, None for requests that did not succeed.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> await gather_queries_async([(AmComSurv, (2019, 'B01001', MYKEY, 1))])
+    >>> await close_async_client()
+    """
+    return await _gather(_async_client(), calls)
+
+async def close_async_client():
+    """Closes the connection that gather_queries_async and iter_years_async keep open on the running event loop.
+    Await it when done with them, e.g. before the loop ends; the next call opens a new connection.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> await close_async_client()
+    """
+    client = _ASYNC_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+async def _gather(client, calls):
+    tasks = [asyncio.create_task(_query_async(client, *call)) for call in calls]
+    return await asyncio.gather(*tasks)
+
+async def _gather_and_close(calls):
+    # asyncio.run closes its loop afterwards, so the client cannot be reused and is closed here
+    try:
+        return await gather_queries_async(calls)
+    finally:
+        await close_async_client()
+
+def gather_queries(calls):
+    """Runs many queries concurrently on one event loop, so N calls take about as long as the slowest one instead of N round trips.
+
+    Parameters
+    ----------
+    calls: list
+        (function, args) or (function, args, kwargs) tuples, where function is one of the query functions of this module.
+        lazy=True is honoured for the functions that take it and gives a LazyDataFrame.
+
+    Returns
+    -------
+    list
+        Pandas dataframes in the same order as calls, None for requests that did not succeed.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> gather_queries([(YrSupplemental, (2019, MYKEY), {'state': '06'}), (manufacturing, (2017, '31-33', MYKEY))])
+    """
+    return asyncio.run(_gather_and_close(calls))
+
+def AmComSurv_many(params_list, key):
+    """Gets many American Community Survey detailed tables at once, issuing all requests concurrently.
+
+    Parameters
+    ----------
+    params_list: list
+        (year, group, yr) tuples, with the same meaning as the arguments of AmComSurv.
+    key: str
+        API key requested from US census.gov website
+
+    Returns
+    -------
+    list
+        Pandas dataframes in the same order as params_list, None for requests that did not succeed.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> AmComSurv_many([(year, 'B01001', 1) for year in range(2010, 2020)], MYKEY)
+    """
+    calls = [(AmComSurv, (year, group, key, yr)) for year, group, yr in params_list]
+    return gather_queries(calls)
+
+def iter_years(years, group, key, yr, prefetch=True):
+    """Yields the American Community Survey detailed table of each year in turn. With prefetch, the request for the next
+    year is already running while the caller works on the current dataframe.
+
+    Parameters
+    ----------
+    years: list
+        years to query, see AmComSurv.
+    group: str
+        Subgroup of population, indexed by list provided in API documentation.
+    key: str
+        API key requested from US census.gov website
+    yr: int
+        1, 3, or 5 for 1 year, 3 year, and 5 year data.
+    prefetch: bool
+        whether to fetch the next year in the background.
+
+    Returns
+    -------
+    generator
+        Pandas dataframes in the order of years.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> for df in iter_years(range(2010, 2020), 'B01001', MYKEY, 1):
+    ...     print(df['B01001_001E'].sum())
+    """
+    if not prefetch:
+        for year in years:
+            yield AmComSurv(year, group, key, yr)
+        return
+    # one request ahead of the caller, so breaking out of the loop early leaves at most one request to wait for
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        pending = None
+        for year in years:
+            future = ex.submit(AmComSurv, year, group, key, yr)
+            if pending is not None:
+                yield pending.result()
+            pending = future
+        if pending is not None:
+            yield pending.result()
+
+async def iter_years_async(years, group, key, yr):
+    """Asynchronous version of iter_years, the next year's request runs on the event loop while the caller awaits other work.
+    Like gather_queries_async, it keeps the loop's connection open until close_async_client() is awaited.
+
+    Examples
+    --------
+    >>> from us_census import us_census
+    >>> async for df in iter_years_async(range(2010, 2020), 'B01001', MYKEY, 1):
+    ...     print(df['B01001_001E'].sum())
+    >>> await close_async_client()
+    """
+    client = _async_client()
+    current = pending = None
+    try:
+        for year in years:
+            # pending is the newest request, started before the caller gets the previous year's result
+            current, pending = pending, asyncio.create_task(_query_async(client, AmComSurv, (year, group, key, yr)))
+            if current is not None:
+                yield await current
+        current, pending = pending, None
+        if current is not None:
+            yield await current
+    finally:
+        # the caller stopped early (break, aclose or cancellation), the requests still running are no longer needed
+        for task in (current, pending):
+            if task is not None and not task.done():
+                task.cancel()